@@ -0,0 +1,198 @@
+import re
+from pathlib import Path
+
+import numpy as np
+
+from experiment import CONFIG
+from tokenization import TokenizerLibrary, ids_to_tokens
+
+TOP_K = CONFIG.get("analytics", {}).get("top_k", 10)
+FLUSH_SIZE = 1 << 20
+BYTE_TOKEN_PATTERN = re.compile(r"^<0x[0-9A-Fa-f]{2}>$")
+
+SCALAR_FIELDS = [
+    "total_tokens", "unique_tokens", "vocab_size", "coverage_pct",
+    "entropy_bits", "normalized_entropy", "zipf_slope", "byte_fallback_pct",
+]
+
+
+class TokenHistogram:
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._chunks: list[np.ndarray] = []
+        self._buffered = 0
+
+    def add(self, ids: list[int]) -> None:
+        self._chunks.append(np.asarray(ids, dtype=np.int32))
+        self._buffered += len(ids)
+        if self._buffered >= FLUSH_SIZE:
+            self._flush()
+
+    def finalize(self) -> np.ndarray:
+        self._flush()
+        return self.counts
+
+    def _flush(self) -> None:
+        if not self._chunks:
+            return
+
+        chunk = np.bincount(np.concatenate(self._chunks))
+        if chunk.size > self.counts.size:
+            self.counts = np.pad(self.counts, (0, chunk.size - self.counts.size))
+        self.counts[:chunk.size] += chunk
+        self._chunks, self._buffered = [], 0
+
+
+def vocab_size(tok_type: TokenizerLibrary, tok_obj) -> int:
+    if tok_type == TokenizerLibrary.TIKTOKEN:
+        return tok_obj.n_vocab
+    return len(tok_obj)
+
+
+def byte_fallback_mask(ids: np.ndarray, pieces: list[str], tok_type: TokenizerLibrary, tok_obj) -> np.ndarray:
+    if tok_type == TokenizerLibrary.TIKTOKEN:
+        return np.array(["\ufffd" in piece for piece in pieces], dtype=bool)
+
+    return np.array([
+        bool(BYTE_TOKEN_PATTERN.match(piece)) or "\ufffd" in tok_obj.decode([i])
+        for i, piece in zip(ids.tolist(), pieces)
+    ], dtype=bool)
+
+
+def _add_counts(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if a.size < b.size:
+        a, b = b, a
+    total = a.copy()
+    total[:b.size] += b
+    return total
+
+
+def collect_token_counts(histograms: dict[str, TokenHistogram], tok_type: TokenizerLibrary, tok_obj) -> dict:
+    counts = {lang: hist.finalize() for lang, hist in histograms.items()}
+    used = np.unique(np.concatenate([np.flatnonzero(c) for c in counts.values()]))
+    pieces = ids_to_tokens(used.tolist(), tok_type, tok_obj)
+
+    return {
+        "vocab_size": vocab_size(tok_type, tok_obj),
+        "piece_ids": used,
+        "pieces": pieces,
+        "fallback_ids": used[byte_fallback_mask(used, pieces, tok_type, tok_obj)],
+        "counts": counts,
+    }
+
+
+def merge_token_counts(parts: list[dict]) -> dict:
+    pieces = {}
+    for part in parts:
+        pieces.update(zip(part["piece_ids"].tolist(), part["pieces"]))
+    piece_ids = sorted(pieces)
+
+    counts = {}
+    for part in parts:
+        for lang, lang_counts in part["counts"].items():
+            counts[lang] = _add_counts(counts[lang], lang_counts) if lang in counts else lang_counts
+
+    return {
+        "vocab_size": max(part["vocab_size"] for part in parts),
+        "piece_ids": np.array(piece_ids, dtype=np.int64),
+        "pieces": [pieces[i] for i in piece_ids],
+        "fallback_ids": np.unique(np.concatenate([part["fallback_ids"] for part in parts])),
+        "counts": counts,
+    }
+
+
+def token_counts_to_json(token_counts: dict) -> dict:
+    return {
+        "vocab_size": token_counts["vocab_size"],
+        "piece_ids": token_counts["piece_ids"].tolist(),
+        "pieces": token_counts["pieces"],
+        "fallback_ids": token_counts["fallback_ids"].tolist(),
+        "counts": {
+            lang: {"ids": np.flatnonzero(c).tolist(), "counts": c[np.flatnonzero(c)].tolist()}
+            for lang, c in token_counts["counts"].items()
+        },
+    }
+
+
+def token_counts_from_json(data: dict) -> dict:
+    counts = {}
+    for lang, sparse in data["counts"].items():
+        ids = np.array(sparse["ids"], dtype=np.int64)
+        dense = np.zeros(ids.max() + 1 if ids.size else 0, dtype=np.int64)
+        dense[ids] = sparse["counts"]
+        counts[lang] = dense
+
+    return {
+        "vocab_size": data["vocab_size"],
+        "piece_ids": np.array(data["piece_ids"], dtype=np.int64),
+        "pieces": data["pieces"],
+        "fallback_ids": np.array(data["fallback_ids"], dtype=np.int64),
+        "counts": counts,
+    }
+
+
+def _zipf_slope(freqs: np.ndarray) -> float:
+    if freqs.size < 2:
+        return float("nan")
+
+    ranked = np.sort(freqs)[::-1]
+    ranks = np.arange(1, ranked.size + 1)
+    return float(np.polyfit(np.log(ranks), np.log(ranked), 1)[0])
+
+
+def _summarize_lang(counts: np.ndarray, vocab: int, pieces: dict[int, str], fallback_ids: np.ndarray) -> dict:
+    used = np.flatnonzero(counts)
+    freqs = counts[used]
+    total = int(freqs.sum())
+
+    probs = freqs / total if total else freqs.astype(float)
+    entropy = float(-(probs * np.log2(probs)).sum()) if total else 0.0
+    max_entropy = np.log2(used.size) if used.size > 1 else 0.0
+
+    order = np.argsort(freqs, kind="stable")[::-1][:TOP_K]
+    top_ids = used[order]
+    fallback = np.isin(used, fallback_ids)
+
+    return {
+        "total_tokens": total,
+        "unique_tokens": int(used.size),
+        "vocab_size": vocab,
+        "coverage_pct": used.size / vocab * 100 if vocab else 0.0,
+        "entropy_bits": entropy,
+        "normalized_entropy": entropy / max_entropy if max_entropy else 0.0,
+        "zipf_slope": _zipf_slope(freqs),
+        "byte_fallback_pct": freqs[fallback].sum() / total * 100 if total else 0.0,
+        "top_ids": top_ids,
+        "top_counts": freqs[order],
+        "top_tokens": [pieces[i] for i in top_ids.tolist()],
+        "ids": used,
+        "counts": freqs,
+    }
+
+
+def summarize_token_counts(token_counts: dict) -> dict[str, dict]:
+    pieces = dict(zip(token_counts["piece_ids"].tolist(), token_counts["pieces"]))
+    return {
+        lang: _summarize_lang(counts, token_counts["vocab_size"], pieces, token_counts["fallback_ids"])
+        for lang, counts in token_counts["counts"].items()
+    }
+
+
+def save_token_stats(token_stats: dict[str, dict[str, dict]], output_path: Path) -> None:
+    cells = [(tok, lang) for tok, by_lang in token_stats.items() for lang in by_lang]
+    arrays = {
+        "tokenizers": np.array([tok for tok, _ in cells]),
+        "langs": np.array([lang for _, lang in cells]),
+    }
+
+    for field in SCALAR_FIELDS:
+        arrays[field] = np.array([token_stats[tok][lang][field] for tok, lang in cells])
+
+    for idx, (tok, lang) in enumerate(cells):
+        stats = token_stats[tok][lang]
+        arrays[f"ids_{idx}"] = stats["ids"].astype(np.int32)
+        arrays[f"counts_{idx}"] = stats["counts"].astype(np.int32)
+        arrays[f"top_ids_{idx}"] = stats["top_ids"].astype(np.int32)
+
+    np.savez_compressed(output_path, **arrays)
+    print(f"Token analytics saved to: {output_path}")
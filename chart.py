@@ -1,6 +1,10 @@
+import argparse
 import csv
+import hashlib
 import json
 import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import matplotlib
@@ -40,34 +44,65 @@ ACCENT_GREEN = COLORS["accent_green"]
 FIGURE_CONFIG = CHART_CONFIG["figure"]
 
 
-def load_csv_data(csv_path: Path) -> dict[str, dict[str, list[float]]]:
-    tokenizer_names = [tok["name"] for tok in CONFIG["tokenizers"]]
+TABLE_TITLES = {
+    "raw": "Sredni narzut tokenizacji vs angielski (%)",
+    "normalized": "Znormalizowany narzut tokenizacji vs angielski (%) - tokeny/znak",
+}
 
-    raw_values = {lang: [0.0] * len(tokenizer_names) for lang in TABLE_ROW_LABELS}
-    norm_values = {lang: [0.0] * len(tokenizer_names) for lang in TABLE_ROW_LABELS}
 
-    counts = {lang: [0] * len(tokenizer_names) for lang in TABLE_ROW_LABELS}
+def load_sentence_domains(corpus_path: Path) -> dict[str, str]:
+    if not corpus_path.exists():
+        return {}
+
+    with open(corpus_path, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    source_domains = {src["title"]: src["domain"] for src in corpus.get("metadata", {}).get("sources", [])}
+    return {
+        sent["id"]: source_domains[sent["source"]]
+        for sent in corpus["sentences"] if sent.get("source") in source_domains
+    }
+
+
+def load_aggregates(csv_path: Path, domains: dict[str, str]) -> dict:
+    sums = {}
+    sentences = {}
 
     with open(csv_path, encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            lang = row["lang"]
-            tokenizer = row["tokenizer"]
+            domain = domains.get(row["sentence"])
+            sentences.setdefault(domain, set()).add(row["sentence"])
 
-            if lang not in TABLE_ROW_LABELS:
+            if row["lang"] not in TABLE_ROW_LABELS:
                 continue
 
-            try:
-                tok_idx = tokenizer_names.index(tokenizer)
-            except ValueError:
-                continue
+            acc = sums.setdefault((domain, row["lang"], row["tokenizer"]), [0.0, 0.0, 0])
+            acc[0] += float(row["overhead_pct"])
+            acc[1] += float(row["normalized_overhead_pct"])
+            acc[2] += 1
+
+    return {"sums": sums, "sentences": {domain: len(ids) for domain, ids in sentences.items()}}
+
+
+def view_data(aggregates: dict, tokenizer_names: list[str], domain: str | None = None) -> dict[str, dict[str, list[float]]]:
+    raw_values = {lang: [0.0] * len(tokenizer_names) for lang in TABLE_ROW_LABELS}
+    norm_values = {lang: [0.0] * len(tokenizer_names) for lang in TABLE_ROW_LABELS}
+
+    counts = {lang: [0] * len(tokenizer_names) for lang in TABLE_ROW_LABELS}
 
-            overhead = float(row["overhead_pct"])
-            normalized = float(row["normalized_overhead_pct"])
+    for (row_domain, lang, tokenizer), (overhead, normalized, count) in aggregates["sums"].items():
+        if domain is not None and row_domain != domain:
+            continue
 
-            raw_values[lang][tok_idx] += overhead
-            norm_values[lang][tok_idx] += normalized
-            counts[lang][tok_idx] += 1
+        try:
+            tok_idx = tokenizer_names.index(tokenizer)
+        except ValueError:
+            continue
+
+        raw_values[lang][tok_idx] += overhead
+        norm_values[lang][tok_idx] += normalized
+        counts[lang][tok_idx] += count
 
     for lang in TABLE_ROW_LABELS:
         for idx in range(len(tokenizer_names)):
@@ -78,6 +113,11 @@ def load_csv_data(csv_path: Path) -> dict[str, dict[str, list[float]]]:
     return {"raw": raw_values, "normalized": norm_values}
 
 
+def load_csv_data(csv_path: Path) -> dict[str, dict[str, list[float]]]:
+    tokenizer_names = [tok["name"] for tok in CONFIG["tokenizers"]]
+    return view_data(load_aggregates(csv_path, {}), tokenizer_names)
+
+
 def _format_cell(val: float) -> str:
     sign = "+" if val >= 0 else ""
     return f"{sign}{val:.1f}%"
@@ -95,7 +135,9 @@ def _colors_for(val: float) -> tuple[str, str]:
     return last["text"], last["background"]
 
 
-def draw_table(ax, title: str, value_data: dict[str, list[float]]) -> None:
+def draw_table(
+    ax, title: str, value_data: dict[str, list[float]], col_headers: list[str] = TABLE_COL_HEADERS
+) -> None:
     ax.set_facecolor(BG_COLOR)
     ax.axis("off")
     ax.set_title(
@@ -107,7 +149,7 @@ def draw_table(ax, title: str, value_data: dict[str, list[float]]) -> None:
     row_labels = [f"{code}  {name}" for code, name in zip(TABLE_ROW_LABELS, TABLE_ROW_NAMES)]
 
     table = ax.table(
-        cellText=cell_text, rowLabels=row_labels, colLabels=TABLE_COL_HEADERS,
+        cellText=cell_text, rowLabels=row_labels, colLabels=col_headers,
         cellLoc="center", rowLoc="right", loc="upper center",
         bbox=[0.0, 0.02, 1.0, 0.95],
     )
@@ -137,17 +179,14 @@ def draw_table(ax, title: str, value_data: dict[str, list[float]]) -> None:
             cell.set_height(0.115)
 
 
-def main() -> None:
-    script_dir = Path(__file__).parent
-    csv_path = script_dir / "results_detailed.csv"
-
-    if not csv_path.exists():
-        logger.error(f"CSV file not found: {csv_path}")
-        logger.error("Please run experiment.py first to generate results_detailed.csv")
-        return
-
-    data = load_csv_data(csv_path)
-    logger.info("Loaded data from CSV")
+def render_chart(
+    data: dict[str, dict[str, list[float]]],
+    output_path: Path,
+    subtitle: str,
+    metrics: list[str] | None = None,
+    col_headers: list[str] = TABLE_COL_HEADERS
+) -> None:
+    metrics = metrics or ["raw", "normalized"]
 
     sns.set_theme(style="dark", rc={
         "axes.facecolor": PANEL_BG, "figure.facecolor": BG_COLOR,
@@ -156,43 +195,164 @@ def main() -> None:
         "grid.color": GRID_COLOR, "axes.edgecolor": GRID_COLOR,
     })
 
+    height = FIGURE_CONFIG["height"] * (1 + len(metrics)) / 3
+    scale = FIGURE_CONFIG["height"] / height
+
     fig = plt.figure(
-        figsize=(FIGURE_CONFIG["width"], FIGURE_CONFIG["height"]),
+        figsize=(FIGURE_CONFIG["width"], height),
         dpi=FIGURE_CONFIG["dpi"]
     )
     fig.patch.set_facecolor(BG_COLOR)
 
     gs = fig.add_gridspec(
-        2, 1, height_ratios=[1.0, 1.0], hspace=0.18,
-        left=0.18, right=0.95, top=0.88, bottom=0.06
+        len(metrics), 1, height_ratios=[1.0] * len(metrics), hspace=0.18,
+        left=0.18, right=0.95, top=1 - 0.12 * scale, bottom=0.06 * scale
     )
 
     fig.text(
-        0.50, 0.96, "Narzut tokenizacji",
+        0.50, 1 - 0.04 * scale, "Narzut tokenizacji",
         ha="center", va="center", fontsize=24, fontweight="bold",
         color=TEXT_COLOR, fontfamily="sans-serif"
     )
     fig.text(
-        0.50, 0.93,
-        "Sredni % roznicy w liczbie tokenow - 100 zdan z artykulow Wikipedia, 5 tokenizerow",
+        0.50, 1 - 0.07 * scale, subtitle,
         ha="center", va="center", fontsize=13, color=TEXT_SECONDARY, fontfamily="sans-serif"
     )
 
-    draw_table(
-        fig.add_subplot(gs[0]),
-        "Sredni narzut tokenizacji vs angielski (%)",
-        data["raw"]
-    )
-    draw_table(
-        fig.add_subplot(gs[1]),
-        "Znormalizowany narzut tokenizacji vs angielski (%) - tokeny/znak",
-        data["normalized"]
-    )
+    for idx, metric in enumerate(metrics):
+        draw_table(fig.add_subplot(gs[idx]), TABLE_TITLES[metric], data[metric], col_headers)
 
-    output_path = script_dir.parent / "grafika.png"
     fig.savefig(output_path, dpi=FIGURE_CONFIG["save_dpi"], bbox_inches="tight", pad_inches=0.3)
     plt.close(fig)
 
+
+def _render_job(job: dict) -> str:
+    render_chart(job["data"], Path(job["output_path"]), job["subtitle"], job["metrics"], job["col_headers"])
+    return job["output_path"]
+
+
+def _view_jobs(view: dict, aggregates: dict, output_dir: Path) -> list[dict]:
+    tokenizer_names = [tok["name"] for tok in CONFIG["tokenizers"]]
+    headers = dict(zip(tokenizer_names, TABLE_COL_HEADERS))
+
+    names = view.get("tokenizers", tokenizer_names)
+    domain = view.get("domain")
+    metrics = view.get("metrics", ["raw", "normalized"])
+
+    if domain is None:
+        n_sentences = sum(aggregates["sentences"].values())
+        scope = "zdan"
+    else:
+        n_sentences = aggregates["sentences"].get(domain, 0)
+        scope = f"zdan ({domain})"
+
+    if n_sentences == 0:
+        logger.warning(f"View '{view['name']}': no sentences for domain '{domain}', skipping")
+        return []
+
+    data = view_data(aggregates, names, domain)
+    return [
+        {
+            "data": {metric: data[metric] for metric in metrics},
+            "output_path": str(output_dir / f"{view['name']}.{fmt}"),
+            "subtitle": f"Sredni % roznicy w liczbie tokenow - {n_sentences} {scope}, {len(names)} tokenizerow",
+            "metrics": metrics,
+            "col_headers": [headers.get(name, name) for name in names],
+        }
+        for fmt in view.get("formats", ["png"])
+    ]
+
+
+def _job_digest(job: dict) -> str:
+    payload = json.dumps({"job": job, "chart": CHART_CONFIG}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _write_json_atomic(data: dict, path: Path) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    tmp_path.replace(path)
+
+
+def render_views(
+    views: list[dict], csv_path: Path, corpus_path: Path, output_dir: Path, workers: int | None = None
+) -> list[str]:
+    aggregates = load_aggregates(csv_path, load_sentence_domains(corpus_path))
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest_path = output_dir / "manifest.json"
+    manifest = {}
+    if manifest_path.exists():
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    pending = []
+    skipped = 0
+    for view in views:
+        for job in _view_jobs(view, aggregates, output_dir):
+            digest = _job_digest(job)
+            name = Path(job["output_path"]).name
+            if manifest.get(name) == digest and Path(job["output_path"]).exists():
+                skipped += 1
+                continue
+            pending.append((name, digest, job))
+
+    logger.info(f"Rendering {len(pending)} charts ({skipped} unchanged, skipped)")
+
+    failed = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_render_job, job): (name, digest) for name, digest, job in pending}
+            for future in as_completed(futures):
+                name, digest = futures[future]
+                try:
+                    output_path = future.result()
+                except Exception as e:
+                    manifest.pop(name, None)
+                    failed.append(name)
+                    logger.error(f"Chart {name} failed: {e}")
+                    continue
+
+                manifest[name] = digest
+                _write_json_atomic(manifest, manifest_path)
+                logger.info(f"Chart saved: {output_path}")
+
+    _write_json_atomic(manifest, manifest_path)
+    return sorted(failed)
+
+
+def main() -> None:
+    script_dir = Path(__file__).parent
+    csv_path = script_dir / "results_detailed.csv"
+
+    parser = argparse.ArgumentParser(description="Render tokenization overhead charts")
+    parser.add_argument("--batch", action="store_true", help="render every view from chart.views in config.json")
+    parser.add_argument("--output-dir", type=Path, default=script_dir / "charts")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if not csv_path.exists():
+        logger.error(f"CSV file not found: {csv_path}")
+        logger.error("Please run experiment.py first to generate results_detailed.csv")
+        return
+
+    if args.batch:
+        failed = render_views(CHART_CONFIG["views"], csv_path, script_dir / "corpus.json", args.output_dir, args.workers)
+        if failed:
+            logger.error(f"{len(failed)} charts failed: {', '.join(failed)}")
+            sys.exit(1)
+        return
+
+    data = load_csv_data(csv_path)
+    logger.info("Loaded data from CSV")
+
+    output_path = script_dir.parent / "grafika.png"
+    render_chart(
+        data, output_path,
+        "Sredni % roznicy w liczbie tokenow - 100 zdan z artykulow Wikipedia, 5 tokenizerow"
+    )
+
     logger.info(f"Chart saved: {output_path}")
 
 
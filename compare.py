@@ -0,0 +1,330 @@
+import argparse
+import csv
+import json
+import logging
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+KEY_FIELDS = ["sentence", "lang", "tokenizer"]
+MAX_CHANGED_LISTED = 20
+
+
+def _load_csv(csv_path: Path) -> dict[str, np.ndarray]:
+    indexes = {field: {} for field in KEY_FIELDS}
+    codes = {field: [] for field in KEY_FIELDS}
+    counts, overheads = [], []
+
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        key_columns = [(header.index(field), indexes[field], codes[field]) for field in KEY_FIELDS]
+        count_col, overhead_col = header.index("count"), header.index("overhead_pct")
+
+        for row in reader:
+            for col, index, column_codes in key_columns:
+                column_codes.append(index.setdefault(row[col], len(index)))
+            counts.append(row[count_col])
+            overheads.append(row[overhead_col])
+
+    return {
+        **{field: np.array(values, dtype=np.int64) for field, values in codes.items()},
+        **{f"{field}_labels": np.array(list(index), dtype=str) for field, index in indexes.items()},
+        "count": np.array(counts, dtype=np.int64),
+        "overhead_pct": np.array(overheads, dtype=np.float64),
+    }
+
+
+def load_detailed(path: Path) -> dict[str, np.ndarray]:
+    if path.suffix == ".csv":
+        return _load_csv(path)
+
+    with np.load(path) as data:
+        return {
+            **{field: data[field].astype(np.int64) for field in KEY_FIELDS},
+            **{f"{field}_labels": data[f"{field}_labels"] for field in KEY_FIELDS},
+            "count": data["count"],
+            "overhead_pct": data["overhead_pct"],
+        }
+
+
+def align_labels(old: dict[str, np.ndarray], new: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    labels = {}
+
+    for field in KEY_FIELDS:
+        labels[field] = np.union1d(old[f"{field}_labels"], new[f"{field}_labels"])
+        for data in (old, new):
+            data[field] = np.searchsorted(labels[field], data[f"{field}_labels"])[data[field]]
+
+    return labels
+
+
+def _cell_codes(data: dict[str, np.ndarray], labels: dict[str, np.ndarray]) -> np.ndarray:
+    return data["lang"] * labels["tokenizer"].size + data["tokenizer"]
+
+
+def _row_keys(data: dict[str, np.ndarray], labels: dict[str, np.ndarray]) -> np.ndarray:
+    return data["sentence"] * (labels["lang"].size * labels["tokenizer"].size) + _cell_codes(data, labels)
+
+
+def _cell_label(cell: int, labels: dict[str, np.ndarray]) -> tuple[str, str]:
+    lang, tok = divmod(cell, labels["tokenizer"].size)
+    return str(labels["lang"][lang]), str(labels["tokenizer"][tok])
+
+
+def _cell_sums(data: dict[str, np.ndarray]) -> dict[tuple[str, str], dict]:
+    labels = {field: data[f"{field}_labels"] for field in KEY_FIELDS}
+    cells, codes = np.unique(_cell_codes(data, labels), return_inverse=True)
+    n = np.bincount(codes, minlength=cells.size)
+
+    sums = {}
+    for field in ("count", "overhead_pct"):
+        vals = data[field].astype(np.float64)
+        sums[field] = (
+            np.bincount(codes, weights=vals, minlength=cells.size),
+            np.bincount(codes, weights=vals ** 2, minlength=cells.size),
+        )
+
+    return {
+        _cell_label(cell, labels): {
+            field: [int(n[i]), float(total[i]), float(total_sq[i])] for field, (total, total_sq) in sums.items()
+        }
+        for i, cell in enumerate(cells.tolist())
+    }
+
+
+def load_aggregates(path: Path) -> dict[tuple[str, str], dict]:
+    if path.suffix != ".json":
+        return _cell_sums(load_detailed(path))
+
+    with open(path, encoding="utf-8") as f:
+        aggregates = json.load(f)
+
+    return {
+        (lang, tok): {field: by_field[field] for field in ("count", "overhead_pct")}
+        for lang, by_tok in aggregates.items() for tok, by_field in by_tok.items()
+    }
+
+
+def _p_value(z: float) -> float:
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def _z_score(mean: float, std_err: float) -> float:
+    if std_err > 0:
+        return mean / std_err
+    return 0.0 if mean == 0 else math.copysign(math.inf, mean)
+
+
+def _has_duplicates(keys: np.ndarray) -> bool:
+    ordered = np.sort(keys)
+    return bool((ordered[1:] == ordered[:-1]).any())
+
+
+def compare_detailed(
+    old: dict[str, np.ndarray], new: dict[str, np.ndarray], labels: dict[str, np.ndarray]
+) -> dict:
+    old_keys = _row_keys(old, labels)
+    new_keys = _row_keys(new, labels)
+
+    for name, keys in (("old", old_keys), ("new", new_keys)):
+        if _has_duplicates(keys):
+            raise ValueError(f"The {name} run contains duplicate (sentence, lang, tokenizer) rows")
+
+    common, old_idx, new_idx = np.intersect1d(old_keys, new_keys, assume_unique=True, return_indices=True)
+
+    count_old = old["count"][old_idx]
+    count_new = new["count"][new_idx]
+    delta = count_new - count_old
+    overhead_diff = new["overhead_pct"][new_idx] - old["overhead_pct"][old_idx]
+    changed = delta != 0
+
+    cells, codes = np.unique(_cell_codes(old, labels)[old_idx], return_inverse=True)
+    n = np.bincount(codes, minlength=cells.size)
+    old_total = np.bincount(codes, weights=count_old, minlength=cells.size)
+    new_total = np.bincount(codes, weights=count_new, minlength=cells.size)
+    changed_rows = np.bincount(codes, weights=changed, minlength=cells.size)
+    diff_sum = np.bincount(codes, weights=overhead_diff, minlength=cells.size)
+    diff_sq = np.bincount(codes, weights=overhead_diff ** 2, minlength=cells.size)
+
+    results = []
+    for i, cell in enumerate(cells.tolist()):
+        mean_diff = diff_sum[i] / n[i]
+        var = (diff_sq[i] - n[i] * mean_diff ** 2) / (n[i] - 1) if n[i] > 1 else 0.0
+        z = _z_score(mean_diff, math.sqrt(max(var, 0.0) / n[i]))
+        lang, tok = _cell_label(cell, labels)
+        results.append({
+            "lang": lang,
+            "tokenizer": tok,
+            "n": int(n[i]),
+            "old_tokens": float(old_total[i]),
+            "new_tokens": float(new_total[i]),
+            "count_delta_pct": (new_total[i] - old_total[i]) / old_total[i] * 100 if old_total[i] else 0.0,
+            "changed_rows": int(changed_rows[i]),
+            "overhead_shift": mean_diff,
+            "p_value": _p_value(z),
+        })
+
+    sentence_names = labels["sentence"]
+    changed_idx = old_idx[changed]
+    changed_old = count_old[changed]
+    changed_new = count_new[changed]
+    changed_cells = _cell_codes(old, labels)[changed_idx]
+    order = np.argsort(-np.abs(delta[changed]), kind="stable")[:MAX_CHANGED_LISTED]
+
+    return {
+        "cells": results,
+        "changed_sentences": sentence_names[np.unique(old["sentence"][changed_idx])].tolist(),
+        "top_changes": [
+            (
+                (str(sentence_names[old["sentence"][changed_idx[i]]]), *_cell_label(int(changed_cells[i]), labels)),
+                int(changed_old[i]),
+                int(changed_new[i]),
+            )
+            for i in order.tolist()
+        ],
+        "only_old": int(old_keys.size - common.size),
+        "only_new": int(new_keys.size - common.size),
+    }
+
+
+def compare_aggregates(
+    old: dict[str, dict[str, list[float]]], new: dict[str, dict[str, list[float]]]
+) -> dict:
+    cells = []
+
+    for label in sorted(set(old) & set(new)):
+        n_old, count_old, _ = old[label]["count"]
+        n_new, count_new, _ = new[label]["count"]
+        mean_old = count_old / n_old
+        mean_new = count_new / n_new
+
+        moments = []
+        for n, total, total_sq in (old[label]["overhead_pct"], new[label]["overhead_pct"]):
+            mean = total / n
+            var = (total_sq - n * mean ** 2) / (n - 1) if n > 1 else 0.0
+            moments.append((n, mean, max(var, 0.0)))
+
+        (n_a, mean_a, var_a), (n_b, mean_b, var_b) = moments
+        shift = mean_b - mean_a
+        z = _z_score(shift, math.sqrt(var_a / n_a + var_b / n_b))
+        lang, tok = label
+        cells.append({
+            "lang": lang,
+            "tokenizer": tok,
+            "n": int(min(n_old, n_new)),
+            "old_tokens": count_old,
+            "new_tokens": count_new,
+            "count_delta_pct": (mean_new - mean_old) / mean_old * 100 if mean_old else 0.0,
+            "changed_rows": None,
+            "overhead_shift": shift,
+            "p_value": _p_value(z),
+        })
+
+    return {
+        "cells": cells,
+        "changed_sentences": None,
+        "top_changes": [],
+        "only_old": len(set(old) - set(new)),
+        "only_new": len(set(new) - set(old)),
+    }
+
+
+def _signed(val: float, suffix: str = "%") -> str:
+    return f"+{val:.2f}{suffix}" if val >= 0 else f"{val:.2f}{suffix}"
+
+
+def format_comparison(comparison: dict, threshold: float) -> str:
+    lines = [
+        "## Porownanie przebiegow (nowy vs stary)\n",
+        "| Jezyk | Tokenizer | n | Zmiana liczby tokenow | Zmienione wiersze | Przesuniecie narzutu (pp) | p |",
+        "|-------|-----------|---|-----------------------|-------------------|---------------------------|---|",
+    ]
+
+    for c in comparison["cells"]:
+        flag = " **!**" if abs(c["count_delta_pct"]) > threshold else ""
+        changed = "-" if c["changed_rows"] is None else str(c["changed_rows"])
+        lines.append(
+            f"| {c['lang']} | {c['tokenizer']} | {c['n']} | {_signed(c['count_delta_pct'])}{flag} | {changed} "
+            f"| {_signed(c['overhead_shift'], '')} | {c['p_value']:.3g} |"
+        )
+
+    lines.append("")
+    if comparison["only_old"] or comparison["only_new"]:
+        lines.append(f"Tylko w starym: {comparison['only_old']}, tylko w nowym: {comparison['only_new']}\n")
+
+    if comparison["changed_sentences"] is not None:
+        lines.append(f"Zdania ze zmieniona liczba tokenow: {len(comparison['changed_sentences'])}\n")
+        for (sent_id, lang, tok), count_old, count_new in comparison["top_changes"]:
+            lines.append(f"- {sent_id} {lang} {tok}: {count_old} -> {count_new}")
+
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare token counts of two experiment runs")
+    parser.add_argument(
+        "old", type=Path,
+        help="results_detailed.npz, results_detailed.csv or results_aggregates.json of the baseline run"
+    )
+    parser.add_argument(
+        "new", type=Path,
+        help="results_detailed.npz, results_detailed.csv or results_aggregates.json of the new run"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.0,
+        help="fail when any cell's total token count changes by more than this many percent"
+    )
+    parser.add_argument(
+        "--allow-missing", action="store_true",
+        help="do not fail when rows or cells exist in only one of the runs"
+    )
+    args = parser.parse_args()
+
+    for path in (args.old, args.new):
+        if not path.exists():
+            logger.error(f"File not found: {path}")
+            sys.exit(2)
+
+    try:
+        if args.old.suffix != ".json" and args.new.suffix != ".json":
+            old, new = load_detailed(args.old), load_detailed(args.new)
+            comparison = compare_detailed(old, new, align_labels(old, new))
+        else:
+            logger.info("Comparing aggregates: overhead shifts use an unpaired test")
+            comparison = compare_aggregates(load_aggregates(args.old), load_aggregates(args.new))
+    except (KeyError, ValueError) as e:
+        logger.error(f"Cannot compare runs: {e}")
+        sys.exit(2)
+
+    print(format_comparison(comparison, args.threshold))
+
+    failed = False
+    failing = [c for c in comparison["cells"] if abs(c["count_delta_pct"]) > args.threshold]
+    if failing:
+        logger.error(f"{len(failing)} cells changed by more than {args.threshold}% of tokens")
+        failed = True
+
+    missing = comparison["only_old"] + comparison["only_new"]
+    if missing and not args.allow_missing:
+        logger.error(
+            f"{comparison['only_old']} entries only in the old run, {comparison['only_new']} only in the new run"
+        )
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+    logger.info("No cell exceeds the threshold")
+
+
+if __name__ == "__main__":
+    main()
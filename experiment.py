@@ -1,11 +1,18 @@
+import argparse
+import gc
+import hashlib
 import json
 import logging
+import math
+import random
 import sys
-from enum import Enum
+from collections import OrderedDict
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+from tokenization import TokenizerLibrary, encode, ids_to_tokens
+
 load_dotenv()
 
 logging.basicConfig(
@@ -15,11 +22,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class TokenizerLibrary(Enum):
-    TIKTOKEN = "tiktoken"
-    TRANSFORMERS = "transformers"
-
-
 def load_config() -> dict:
     config_path = Path(__file__).parent / "config.json"
     with open(config_path, encoding="utf-8") as f:
@@ -60,68 +62,170 @@ def load_corpus(path: Path) -> tuple[dict[str, dict[str, str]] | None, dict | No
     return complete, corpus.get("metadata", {})
 
 
-def load_tokenizers() -> dict[str, tuple[TokenizerLibrary, object]]:
-    tokenizers = {}
+def load_tokenizer(tok_config: dict) -> tuple[TokenizerLibrary, object]:
+    library = tok_config["library"]
+    model_id = tok_config["model_id"]
+
+    if library == TokenizerLibrary.TIKTOKEN.value:
+        import tiktoken
+        return TokenizerLibrary.TIKTOKEN, tiktoken.get_encoding(model_id)
+
+    from transformers import AutoTokenizer
+    return TokenizerLibrary.TRANSFORMERS, AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
+
 
-    for tok_config in CONFIG["tokenizers"]:
-        name = tok_config["name"]
-        library = tok_config["library"]
-        model_id = tok_config["model_id"]
+class TokenizerPool:
+    def __init__(self, tok_configs: list[dict], max_resident: int = 1):
+        if max_resident < 1:
+            raise ValueError(f"max_resident must be at least 1, got {max_resident}")
+
+        self._configs = {tok["name"]: tok for tok in tok_configs}
+        self._resident: OrderedDict[str, tuple[TokenizerLibrary, object]] = OrderedDict()
+        self.max_resident = max_resident
+        self.loaded: list[str] = []
+        self.failed: list[str] = []
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._configs)
+
+    def get(self, name: str) -> tuple[TokenizerLibrary, object] | None:
+        if name in self._resident:
+            self._resident.move_to_end(name)
+            return self._resident[name]
+
+        if name in self.failed:
+            return None
+
+        while len(self._resident) >= self.max_resident:
+            self._evict()
 
         try:
-            if library == TokenizerLibrary.TIKTOKEN.value:
-                import tiktoken
-                tokenizers[name] = (TokenizerLibrary.TIKTOKEN, tiktoken.get_encoding(model_id))
-            else:
-                from transformers import AutoTokenizer
-                tokenizers[name] = (
-                    TokenizerLibrary.TRANSFORMERS,
-                    AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
-                )
-            logger.info(f"[OK] {name}")
+            tokenizer = load_tokenizer(self._configs[name])
         except Exception as e:
             logger.error(f"[FAIL] {name}: {e}")
+            self.failed.append(name)
+            return None
+
+        logger.info(f"[OK] {name}")
+        if name not in self.loaded:
+            self.loaded.append(name)
+        self._resident[name] = tokenizer
+        return tokenizer
 
-    return tokenizers
+    def _evict(self) -> None:
+        name = self._resident.popitem(last=False)[0]
+        logger.info(f"Evicting tokenizer: {name}")
+        gc.collect()
 
 
-def tokenize(text: str, tok_type: TokenizerLibrary, tok_obj) -> tuple[int, list[str]]:
-    if tok_type == TokenizerLibrary.TIKTOKEN:
-        ids = tok_obj.encode(text)
-        return len(ids), [tok_obj.decode([i]) for i in ids]
+class RunningStats:
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
 
-    ids = tok_obj.encode(text, add_special_tokens=False)
-    return len(ids), tok_obj.convert_ids_to_tokens(ids)
+    def add(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def half_width(self, z: float) -> float:
+        if self.n < 2:
+            return math.inf
+        return z * math.sqrt(self.variance / self.n)
+
+
+def _sentence_batches(sentences: dict[str, dict[str, str]], adaptive: dict | None) -> list[list[str]]:
+    sent_ids = list(sentences)
+    if not adaptive:
+        return [sent_ids]
+
+    random.Random(adaptive.get("seed", 42)).shuffle(sent_ids)
+    size = adaptive.get("batch_size", 10)
+    return [sent_ids[i:i + size] for i in range(0, len(sent_ids), size)]
+
+
+def _converged(stats: RunningStats, adaptive: dict) -> bool:
+    return (
+        stats.n >= adaptive.get("min_sentences", 20)
+        and stats.half_width(adaptive.get("z", 1.96)) <= adaptive["tolerance_pct"]
+    )
 
 
 def run_experiment(
     sentences: dict[str, dict[str, str]],
-    tokenizers: dict[str, tuple[TokenizerLibrary, object]]
+    pool: TokenizerPool,
+    adaptive: dict | None = None,
+    token_counts: dict[str, dict] | None = None
 ) -> list[dict]:
     results = []
     total_sentences = len(sentences)
-
-    for idx, sent_id in enumerate(sentences):
-        if (idx + 1) % 10 == 0 or idx == 0:
-            logger.info(f"Sentence {idx + 1}/{total_sentences}...")
-
-        for lang in LANGUAGES:
-            text = sentences[sent_id][lang]
-
-            for tok_name, (tok_type, tok_obj) in tokenizers.items():
-                count, tokens = tokenize(text, tok_type, tok_obj)
-                char_count = len(text)
-
-                results.append({
-                    "sentence": sent_id,
-                    "lang": lang,
-                    "tokenizer": tok_name,
-                    "count": count,
-                    "tokens": tokens,
-                    "text": text,
-                    "char_count": char_count,
-                    "tokens_per_char": count / char_count if char_count else 0,
-                })
+    batches = _sentence_batches(sentences, adaptive)
+    non_en = [lang for lang in LANGUAGES if lang != "EN"]
+
+    if token_counts is not None:
+        from analytics import TokenHistogram, collect_token_counts
+
+    for tok_name in pool.names:
+        tokenizer = pool.get(tok_name)
+        if tokenizer is None:
+            continue
+
+        tok_type, tok_obj = tokenizer
+        logger.info(f"Tokenizing {total_sentences} sentences with {tok_name}...")
+        stats = {lang: RunningStats() for lang in non_en}
+        histograms = {lang: TokenHistogram() for lang in LANGUAGES} if token_counts is not None else None
+        active = list(LANGUAGES)
+
+        for batch in batches:
+            for sent_id in batch:
+                counts = {}
+                for lang in active:
+                    text = sentences[sent_id][lang]
+                    ids = encode(text, tok_type, tok_obj)
+                    tokens = ids_to_tokens(ids, tok_type, tok_obj)
+                    count = len(ids)
+                    char_count = len(text)
+                    counts[lang] = count
+
+                    if histograms is not None:
+                        histograms[lang].add(ids)
+
+                    results.append({
+                        "sentence": sent_id,
+                        "lang": lang,
+                        "tokenizer": tok_name,
+                        "count": count,
+                        "tokens": tokens,
+                        "text": text,
+                        "char_count": char_count,
+                        "tokens_per_char": count / char_count if char_count else 0,
+                    })
+
+                if adaptive and counts.get("EN"):
+                    for lang in active:
+                        if lang != "EN":
+                            stats[lang].add((counts[lang] - counts["EN"]) / counts["EN"] * 100)
+
+            if adaptive:
+                active = [lang for lang in active if lang == "EN" or not _converged(stats[lang], adaptive)]
+                if active == ["EN"]:
+                    break
+
+        if adaptive:
+            used = ", ".join(f"{lang}={stats[lang].n}" for lang in non_en)
+            logger.info(f"Sentences used per language ({tok_name}): {used}")
+
+        if histograms is not None:
+            token_counts[tok_name] = collect_token_counts(histograms, tok_type, tok_obj)
+
+        del tokenizer, tok_obj
 
     return results
 
@@ -164,55 +268,316 @@ def compute_char_normalized_overhead(results: list[dict]) -> list[dict]:
     return results
 
 
-def main() -> None:
+AGGREGATE_FIELDS = [
+    "count", "char_count", "tokens_per_char",
+    "overhead_pct", "char_overhead_pct", "normalized_overhead_pct",
+]
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    try:
+        index, total = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected shard as i/N, got '{value}'")
+
+    if total < 1 or not 0 <= index < total:
+        raise argparse.ArgumentTypeError(f"Shard index must satisfy 0 <= i < N, got '{value}'")
+
+    return index, total
+
+
+def shard_sentences(
+    sentences: dict[str, dict[str, str]], index: int, total: int
+) -> dict[str, dict[str, str]]:
+    return {
+        sent_id: langs for sent_id, langs in sentences.items()
+        if int(hashlib.sha1(sent_id.encode("utf-8")).hexdigest(), 16) % total == index
+    }
+
+
+def aggregate_results(results: list[dict]) -> dict[str, dict[str, dict[str, list[float]]]]:
+    aggregates = {}
+
+    for r in results:
+        cell = aggregates.setdefault(r["lang"], {}).setdefault(r["tokenizer"], {})
+        for field in AGGREGATE_FIELDS:
+            acc = cell.setdefault(field, [0, 0.0, 0.0])
+            acc[0] += 1
+            acc[1] += r[field]
+            acc[2] += r[field] ** 2
+
+    return aggregates
+
+
+def merge_aggregates(
+    parts: list[dict[str, dict[str, dict[str, list[float]]]]]
+) -> dict[str, dict[str, dict[str, list[float]]]]:
+    merged = {}
+
+    for part in parts:
+        for lang, by_tok in part.items():
+            for tok, by_field in by_tok.items():
+                cell = merged.setdefault(lang, {}).setdefault(tok, {})
+                for field, (count, total, total_sq) in by_field.items():
+                    acc = cell.setdefault(field, [0, 0.0, 0.0])
+                    acc[0] += count
+                    acc[1] += total
+                    acc[2] += total_sq
+
+    return merged
+
+
+def _write_json_atomic(data: dict, path: Path) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    tmp_path.replace(path)
+
+
+def _token_counts_to_json(token_counts: dict[str, dict] | None) -> dict | None:
+    if token_counts is None:
+        return None
+
+    from analytics import token_counts_to_json
+    return {tok: token_counts_to_json(counts) for tok, counts in token_counts.items()}
+
+
+def save_partial(
+    results: list[dict],
+    sent_ids: list[str],
+    index: int,
+    total: int,
+    shards_dir: Path,
+    pool: TokenizerPool,
+    token_counts: dict[str, dict] | None = None
+) -> Path:
+    shards_dir.mkdir(parents=True, exist_ok=True)
+    output_path = shards_dir / f"partial_{index:03d}_of_{total:03d}.json"
+
+    _write_json_atomic({
+        "shard": index,
+        "total_shards": total,
+        "sentences": sent_ids,
+        "tokenizers": pool.loaded,
+        "failed_tokenizers": pool.failed,
+        "rows": [{k: v for k, v in r.items() if k != "text"} for r in results],
+        "aggregates": aggregate_results(results),
+        "token_counts": _token_counts_to_json(token_counts),
+    }, output_path)
+
+    return output_path
+
+
+def load_partials(shards_dir: Path, sentences: dict[str, dict[str, str]]) -> list[dict]:
+    paths = sorted(shards_dir.glob("partial_*_of_*.json"))
+    if not paths:
+        raise FileNotFoundError(f"No partial results found in {shards_dir}")
+
+    partials = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            partials.append(json.load(f))
+
+    totals = {p["total_shards"] for p in partials}
+    if len(totals) != 1:
+        raise ValueError(f"Partial results come from different shard counts: {sorted(totals)}")
+
+    total = totals.pop()
+    missing = sorted(set(range(total)) - {p["shard"] for p in partials})
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {total}")
+
+    tokenizer_sets = {frozenset(p["tokenizers"]) for p in partials}
+    if len(tokenizer_sets) != 1:
+        failed = sorted({name for p in partials for name in p["failed_tokenizers"]})
+        raise ValueError(
+            f"Shards were run with different tokenizers (failed on some shards: {', '.join(failed) or '-'}); "
+            f"re-run the affected shards"
+        )
+
+    if len({p.get("token_counts") is None for p in partials}) != 1:
+        raise ValueError("Only some shards were run with analytics enabled; re-run the shards with the same config")
+
+    for p in partials:
+        expected = set(shard_sentences(sentences, p["shard"], total))
+        declared = set(p["sentences"])
+        rows = {r["sentence"] for r in p["rows"]}
+        if declared != expected or not rows <= declared:
+            raise ValueError(
+                f"Shard {p['shard']}/{total} does not match the current corpus "
+                f"({len(declared ^ expected)} sentences differ); re-run the shard"
+            )
+
+    return partials
+
+
+def merge_partials(
+    partials: list[dict], sentences: dict[str, dict[str, str]]
+) -> tuple[list[dict], dict[str, dict[str, dict[str, list[float]]]], dict[str, dict] | None]:
+    tok_order = {tok["name"]: idx for idx, tok in enumerate(CONFIG["tokenizers"])}
+    sent_order = {sent_id: idx for idx, sent_id in enumerate(sentences)}
+    lang_order = {lang: idx for idx, lang in enumerate(LANGUAGES)}
+
+    results = [
+        {**r, "text": sentences[r["sentence"]][r["lang"]]}
+        for p in partials for r in p["rows"]
+    ]
+    results.sort(key=lambda r: (
+        tok_order.get(r["tokenizer"], len(tok_order)), sent_order[r["sentence"]], lang_order[r["lang"]]
+    ))
+
+    return results, merge_aggregates([p["aggregates"] for p in partials]), _merge_token_counts(partials, tok_order)
+
+
+def _merge_token_counts(partials: list[dict], tok_order: dict[str, int]) -> dict[str, dict] | None:
+    if partials[0].get("token_counts") is None:
+        return None
+
+    from analytics import merge_token_counts, token_counts_from_json
+
+    tokenizers = sorted(partials[0]["token_counts"], key=lambda tok: tok_order.get(tok, len(tok_order)))
+    return {
+        tok: merge_token_counts([token_counts_from_json(p["token_counts"][tok]) for p in partials])
+        for tok in tokenizers
+    }
+
+
+def _load_sentences(script_dir: Path) -> tuple[dict[str, dict[str, str]], dict | None]:
+    sentences, metadata = load_corpus(script_dir / "corpus.json")
+
+    if sentences:
+        logger.info(f"Loaded corpus: {len(sentences)} sentences from corpus.json")
+        return sentences, metadata
+
+    logger.info("corpus.json not found — using 4 built-in test sentences")
+    return _load_fallback(), None
+
+
+def _adaptive_config() -> dict | None:
+    adaptive = CONFIG.get("adaptive_sampling", {})
+    return adaptive if adaptive.get("enabled") else None
+
+
+def _save_outputs(
+    results: list[dict],
+    aggregates: dict[str, dict[str, dict[str, list[float]]]],
+    sentences: dict[str, dict[str, str]],
+    metadata: dict | None,
+    script_dir: Path,
+    token_counts: dict[str, dict] | None = None
+) -> None:
     from report import (
         format_summary_table,
         format_normalized_summary_table,
         format_char_analysis,
         format_conclusions,
+        format_sample_sizes,
         save_results_md,
         save_detailed_csv,
+        save_detailed_npz,
     )
 
+    token_stats = None
+    if token_counts:
+        from analytics import summarize_token_counts
+        token_stats = {tok: summarize_token_counts(counts) for tok, counts in token_counts.items()}
+
+    print(format_summary_table(results))
+    print()
+    print(format_char_analysis(sentences))
+    print()
+    print(format_normalized_summary_table(results))
+    print()
+    print(format_conclusions(results))
+
+    if _adaptive_config():
+        print()
+        print(format_sample_sizes(results, len(sentences)))
+
+    save_results_md(results, sentences, metadata, script_dir / "results.md", token_stats)
+    save_detailed_csv(results, script_dir / "results_detailed.csv")
+    save_detailed_npz(results, script_dir / "results_detailed.npz")
+    _write_json_atomic(aggregates, script_dir / "results_aggregates.json")
+
+    if token_stats:
+        from analytics import save_token_stats
+        save_token_stats(token_stats, script_dir / "token_analytics.npz")
+
+
+def run(script_dir: Path, shard: tuple[int, int] | None, shards_dir: Path) -> None:
     logger.info("=== Tokenization experiment ===\n")
 
-    script_dir = Path(__file__).parent
-    corpus_path = script_dir / "corpus.json"
+    sentences, metadata = _load_sentences(script_dir)
+    corpus_size = len(sentences)
 
-    sentences, metadata = load_corpus(corpus_path)
+    if shard:
+        if _adaptive_config():
+            logger.error("--shard cannot be combined with adaptive_sampling: each shard would stop on its own slice")
+            sys.exit(1)
 
-    if sentences:
-        logger.info(f"Loaded corpus: {len(sentences)} sentences from corpus.json")
-    else:
-        logger.info("corpus.json not found — using 4 built-in test sentences")
-        sentences, metadata = _load_fallback(), None
+        index, total = shard
+        sentences = shard_sentences(sentences, index, total)
+        logger.info(f"Shard {index}/{total}: {len(sentences)}/{corpus_size} sentences")
+
+    pool_config = CONFIG.get("tokenizer_pool", {})
+    pool = TokenizerPool(CONFIG["tokenizers"], max_resident=pool_config.get("max_resident", 1))
 
-    logger.info("\nLoading tokenizers...")
-    tokenizers = load_tokenizers()
+    logger.info("\nRunning tokenization...")
+    adaptive = _adaptive_config()
+    if adaptive:
+        logger.info(f"Adaptive sampling: stopping at CI half-width <= {adaptive['tolerance_pct']} pp")
 
-    if not tokenizers:
+    token_counts = {} if CONFIG.get("analytics", {}).get("enabled") else None
+    results = run_experiment(sentences, pool, adaptive, token_counts)
+
+    if not pool.loaded:
         logger.error("No tokenizers available. Exiting.")
         sys.exit(1)
 
     expected_count = len(CONFIG["tokenizers"])
-    logger.info(f"\nLoaded {len(tokenizers)}/{expected_count} tokenizers.\n")
+    logger.info(f"\nLoaded {len(pool.loaded)}/{expected_count} tokenizers.\n")
 
-    logger.info("Running tokenization...")
-    results = compute_char_normalized_overhead(
-        compute_overhead(run_experiment(sentences, tokenizers))
-    )
+    results = compute_char_normalized_overhead(compute_overhead(results))
     logger.info(f"Collected {len(results)} results.\n")
 
-    print(format_summary_table(results))
-    print()
-    print(format_char_analysis(sentences))
-    print()
-    print(format_normalized_summary_table(results))
-    print()
-    print(format_conclusions(results))
+    if shard:
+        output_path = save_partial(results, list(sentences), index, total, shards_dir, pool, token_counts)
+        logger.info(f"Partial results saved to: {output_path}")
+        return
 
-    save_results_md(results, sentences, metadata, script_dir / "results.md")
-    save_detailed_csv(results, script_dir / "results_detailed.csv")
+    _save_outputs(results, aggregate_results(results), sentences, metadata, script_dir, token_counts)
+
+
+def merge(script_dir: Path, shards_dir: Path) -> None:
+    logger.info("=== Merging shard results ===\n")
+
+    sentences, metadata = _load_sentences(script_dir)
+
+    try:
+        partials = load_partials(shards_dir, sentences)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    results, aggregates, token_counts = merge_partials(partials, sentences)
+    logger.info(f"Merged {len(partials)} shards: {len(results)} results.\n")
+
+    _save_outputs(results, aggregates, sentences, metadata, script_dir, token_counts)
+
+
+def main() -> None:
+    script_dir = Path(__file__).parent
+
+    parser = argparse.ArgumentParser(description="Tokenization overhead experiment")
+    parser.add_argument("command", nargs="?", choices=["run", "merge"], default="run")
+    parser.add_argument("--shard", type=parse_shard, help="process only shard i of N (0-based), e.g. 0/4")
+    parser.add_argument("--shards-dir", type=Path, default=script_dir / "shards")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        merge(script_dir, args.shards_dir)
+    else:
+        run(script_dir, args.shard, args.shards_dir)
 
 
 if __name__ == "__main__":
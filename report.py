@@ -2,6 +2,8 @@ import csv
 import math
 from pathlib import Path
 
+import numpy as np
+
 from experiment import LANGUAGES, LANG_NAMES
 
 
@@ -159,6 +161,72 @@ def format_conclusions(results: list[dict]) -> str:
     return "\n".join(lines)
 
 
+def format_sample_sizes(results: list[dict], total_sentences: int) -> str:
+    tok_names = list(dict.fromkeys(r["tokenizer"] for r in results))
+    counts = {}
+    for r in results:
+        key = (r["lang"], r["tokenizer"])
+        counts[key] = counts.get(key, 0) + 1
+
+    lines = [
+        f"## Liczba zdan uzytych w komorce (probkowanie adaptacyjne, z {total_sentences})\n",
+        "| Jezyk | " + " | ".join(tok_names) + " |",
+        "|-------|" + "|".join(["--------"] * len(tok_names)) + "|"
+    ]
+
+    for lang in LANGUAGES:
+        row = f"| **{lang}** ({LANG_NAMES[lang]}) "
+        for tok in tok_names:
+            row += f"| {counts.get((lang, tok), 0)} "
+        lines.append(row + "|")
+
+    return "\n".join(lines)
+
+
+def _format_token_stat_table(
+    token_stats: dict[str, dict[str, dict]], title: str, field: str, fmt: str
+) -> str:
+    tok_names = list(token_stats)
+
+    lines = [
+        f"### {title}\n",
+        "| Jezyk | " + " | ".join(tok_names) + " |",
+        "|-------|" + "|".join(["--------"] * len(tok_names)) + "|"
+    ]
+
+    for lang in LANGUAGES:
+        row = f"| **{lang}** ({LANG_NAMES[lang]}) "
+        for tok in tok_names:
+            stats = token_stats[tok].get(lang)
+            row += f"| {format(stats[field], fmt)} " if stats else "| - "
+        lines.append(row + "|")
+
+    return "\n".join(lines)
+
+
+def format_vocabulary_analytics(token_stats: dict[str, dict[str, dict]]) -> str:
+    lines = [
+        "## Wykorzystanie slownika i rozklad czestosci tokenow\n",
+        _format_token_stat_table(token_stats, "Pokrycie slownika (% unikalnych tokenow)", "coverage_pct", ".2f"), "",
+        _format_token_stat_table(token_stats, "Entropia rozkladu tokenow (bity)", "entropy_bits", ".2f"), "",
+        _format_token_stat_table(token_stats, "Nachylenie Zipfa (log-czestosc vs log-ranga)", "zipf_slope", ".2f"), "",
+        _format_token_stat_table(token_stats, "Udzial tokenow byte-fallback (%)", "byte_fallback_pct", ".1f"), "",
+    ]
+
+    for lang in ["EN", "PL"]:
+        lines.append(f"### Najczestsze tokeny ({lang})\n")
+        for tok, by_lang in token_stats.items():
+            stats = by_lang.get(lang)
+            if stats:
+                top = ", ".join(
+                    f"`{t!r}` ({c})" for t, c in zip(stats["top_tokens"], stats["top_counts"].tolist())
+                )
+                lines.append(f"- **{tok}**: {top}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
 def format_data_sources(metadata: dict | None) -> str:
     lines = ["## Zrodla danych\n"]
 
@@ -193,11 +261,28 @@ def save_detailed_csv(results: list[dict], output_path: Path) -> None:
     print(f"Detail table saved to: {output_path}")
 
 
+def save_detailed_npz(results: list[dict], output_path: Path) -> None:
+    columns = {}
+
+    for field in ("sentence", "lang", "tokenizer"):
+        index = {}
+        codes = np.array([index.setdefault(r[field], len(index)) for r in results], dtype=np.int32)
+        columns[field] = codes
+        columns[f"{field}_labels"] = np.array(list(index), dtype=str)
+
+    columns["count"] = np.array([r["count"] for r in results], dtype=np.int64)
+    columns["overhead_pct"] = np.array([r["overhead_pct"] for r in results], dtype=np.float64)
+
+    np.savez_compressed(output_path, **columns)
+    print(f"Columnar detail table saved to: {output_path}")
+
+
 def save_results_md(
     results: list[dict],
     sentences: dict[str, dict[str, str]],
     metadata: dict | None,
-    output_path: Path
+    output_path: Path,
+    token_stats: dict[str, dict[str, dict]] | None = None
 ) -> None:
     n = len(sentences)
     desc = "100 zdan z artykulow Wikipedia PL" if n >= 100 else f"{n} zdan testowych"
@@ -214,6 +299,12 @@ def save_results_md(
         format_conclusions(results),
     ]
 
+    if len(results) < n * len(LANGUAGES) * len(dict.fromkeys(r["tokenizer"] for r in results)):
+        sections += ["", format_sample_sizes(results, n)]
+
+    if token_stats:
+        sections += ["", format_vocabulary_analytics(token_stats)]
+
     with open(output_path, "w", encoding="utf-8") as f:
         f.write("\n".join(sections))
 
@@ -0,0 +1,19 @@
+from enum import Enum
+
+
+class TokenizerLibrary(Enum):
+    TIKTOKEN = "tiktoken"
+    TRANSFORMERS = "transformers"
+
+
+def encode(text: str, tok_type: TokenizerLibrary, tok_obj) -> list[int]:
+    if tok_type == TokenizerLibrary.TIKTOKEN:
+        return tok_obj.encode(text)
+    return tok_obj.encode(text, add_special_tokens=False)
+
+
+def ids_to_tokens(ids: list[int], tok_type: TokenizerLibrary, tok_obj) -> list[str]:
+    if tok_type == TokenizerLibrary.TIKTOKEN:
+        return [tok_obj.decode([i]) for i in ids]
+    return tok_obj.convert_ids_to_tokens(ids)
+